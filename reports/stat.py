@@ -19,13 +19,13 @@
 # Link to generated documentation for this script:
 # <https://redhatinsights.github.io/insights-results-aggregator-utils/packages/stat.html>
 
-import collections
-import json
-from os import listdir
-from os.path import isfile, join
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from os import scandir
 
-# Retrieve list of files.
-files = [f for f in listdir(".") if isfile(join(".", f))]
+import numpy as np
+import simdjson
 
 # Names of external rules to be processed.
 # Please note that it needs to be updated later.
@@ -61,51 +61,104 @@ rule_names = (
     "ccx_rules_ocp.ocs.pvc_phase_check.report",
 )
 
-# Counter of rules that passed on clusters.
-passed_cnt = collections.Counter()
-
-# Counter of rules that were skipped.
-skipped_cnt = collections.Counter()
-
-# Counter of rules that were reported (hitted).
-reported_cnt = collections.Counter()
-
-# TODO: just a temporary, for quick check.
-files = files[:10]
-
-# Process all files.
-for filename in files:
-    # If it is JSON file with (possibly) cluster reports.
-    if filename.endswith(".json"):
-        # Try to open and parse that file.
-        with open(filename) as fin:
-            data = json.load(fin)
-            if "info" in data:
-                infolist = data["info"]
-                cluster = None
-                for info in infolist:
-                    if info["key"] == "GRAFANA_LINK":
-                        cluster = info["details"]["cluster_id"]
-                # Check cluster status w.r.o. the selected rule
-                if cluster is not None:
-                    if "pass" in data:
-                        passed = data["pass"]
-                        for p in passed:
-                            rule = p["component"]
-                            passed_cnt[rule] += 1
-                    if "skips" in data:
-                        skipped = data["skips"]
-                        for s in skipped:
-                            rule = s["rule_fqdn"]
-                            skipped_cnt[rule] += 1
-                    if "reports" in data:
-                        reports = data["reports"]
-                        for r in reports:
-                            rule = r["component"]
-                            reported_cnt[rule] += 1
-
-# Display statistic to user.
-print("Rule, passed, reported, skipped")
-
-for rule in rule_names:
-    print(rule, passed_cnt[rule], reported_cnt[rule], skipped_cnt[rule], sep=",")
+# Rule names are interned into integer IDs (indexes into `rule_names`), so rule
+# hits can be stored in compact arrays and counted by NumPy.
+rule_ids = {name: i for i, name in enumerate(rule_names)}
+
+# ID used for all rules that are not in `rule_names`. Such rules are counted
+# in an extra counter that is dropped before statistic is displayed.
+unknown_rule_id = len(rule_names)
+
+# Sections of report with rules that passed, were skipped, and were reported
+# (hitted). Each section has its own accessor to rule name stored in section
+# items. Accessors are constructed just once and are evaluated in C. Hits from
+# all sections are stored in one array, IDs of rules from n-th section are
+# shifted by n * (len(rule_names) + 1) to leave room for unknown rules.
+rule_sections = (
+    ("pass", itemgetter("component")),
+    ("skips", itemgetter("rule_fqdn")),
+    ("reports", itemgetter("component")),
+)
+
+# JSON parser that is reused for all files processed by one worker process, so
+# its internal buffers are allocated just once.
+parser = simdjson.Parser()
+
+
+def find_cluster_id(infolist):
+    """Find cluster ID in list of info records, return None if it is not found."""
+    cluster = None
+    for info in infolist:
+        if info["key"] == "GRAFANA_LINK":
+            cluster = info["details"]["cluster_id"]
+    return cluster
+
+
+def append_rule_ids(ids, names, offset):
+    """Append shifted IDs of given rules into array, unknown rules get `unknown_rule_id`."""
+    ids.extend(offset + rule_ids.get(name, unknown_rule_id) for name in names)
+
+
+def process_file(filename):
+    """Retrieve IDs of rules that passed, were skipped, and were reported in given file."""
+    # IDs of rules that passed on clusters, were skipped, and were reported
+    # (hitted), shifted according to section they were found in.
+    ids = array("i")
+
+    # Try to open and parse that file. File content is read directly into
+    # parser's buffer that is reused for all files, so memory consumption is
+    # bounded by the largest file. Parsed document is accessed lazily, so
+    # only values that are really read are converted into Python objects.
+    # Please note that parser can't be reused while any object from previous
+    # document still exists, so all processing is done in this function.
+    data = parser.load(filename)
+    if "info" in data:
+        cluster = find_cluster_id(data["info"])
+        # Check cluster status w.r.o. the selected rule
+        if cluster is not None:
+            for i, (section, rule_name) in enumerate(rule_sections):
+                if section in data:
+                    append_rule_ids(ids, map(rule_name, data[section]), i * (unknown_rule_id + 1))
+
+    return ids
+
+
+def iter_json_files(directory="."):
+    """Yield names of all JSON files (with possibly cluster reports) in given directory."""
+    # File type is usually known from the directory entry itself, so no
+    # additional stat call is needed.
+    with scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                yield entry.name
+
+
+def main():
+    """Process all JSON files in current directory and display statistic."""
+    # Dense counters of rule hits for all sections, including counters for
+    # unknown rules.
+    shape = (len(rule_sections), unknown_rule_id + 1)
+    counters = np.zeros(shape[0] * shape[1], dtype=np.int64)
+
+    # Process all files. Files are independent on each other, so they are
+    # processed in parallel by worker processes (one per CPU by default) and
+    # rule hits from each file are added to counters as soon as they arrive.
+    with ProcessPoolExecutor() as pool:
+        for ids in pool.map(process_file, iter_json_files(), chunksize=32):
+            counters += np.bincount(np.frombuffer(ids, dtype=np.intc), minlength=counters.size)
+
+    # Split counters per section and drop counters for unknown rules. N-th item
+    # in each array is counter for n-th rule.
+    passed_cnt, skipped_cnt, reported_cnt = counters.reshape(shape)[:, :unknown_rule_id]
+
+    # Display statistic to user.
+    print("Rule, passed, reported, skipped")
+
+    for i, rule in enumerate(rule_names):
+        print(rule, passed_cnt[i], reported_cnt[i], skipped_cnt[i], sep=",")
+
+
+# If this script is started from command line, run the `main` function which is
+# entry point to the processing.
+if __name__ == "__main__":
+    main()
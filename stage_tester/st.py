@@ -133,19 +133,42 @@ Generated documentation in literate programming style
 
 
 import requests
-import json
+import orjson
 import sys
 import os
 import csv
+import io
 
 from collections import Counter
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from argparse import ArgumentParser
+from functools import lru_cache
+from threading import Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Data type to represent valid rule selector
 ruleSelector = namedtuple("rule_selector", ["rule_id", "error_key"])
 
+# Data type to represent fields from cluster results that are needed to
+# compare results: rule hits count from metadata and rule selectors of all
+# rule hits
+reportFields = namedtuple("report_fields", ["count", "rule_selectors"])
+
+# HTTP session shared by all REST API calls, so connections (including TLS
+# handshake through proxy) are kept alive and reused between calls
+session = requests.Session()
+session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.2),
+    ),
+)
+
 
 def cli_arguments():
     """Retrieve all CLI arguments provided by user."""
@@ -355,7 +378,7 @@ def main():
 def call_rest_api(url, proxies, auth):
     """Call REST API, retrieve payload, and unmarshal it from JSON."""
     # send request to REST API
-    response = requests.get(url, proxies=proxies, auth=auth)
+    response = session.get(url, proxies=proxies, auth=auth, timeout=30)
 
     # elementary check for response content
     assert response is not None, "Proper response expected"
@@ -394,24 +417,38 @@ def retrieve_results(address, proxies, auth, input_file, verbose):
     """Retrieve results from the external data pipeline REST API endpoint."""
     errors = {}
 
-    cluster_list = read_cluster_list_from_file(input_file)
+    # empty lines in input file are skipped
+    cluster_list = [cluster for cluster in read_cluster_list_from_file(input_file) if cluster]
 
-    for cluster in cluster_list:
-        if verbose:
-            print("Cluster: ", cluster)
+    # results for more clusters are retrieved concurrently, the pool size is
+    # the same as the size of HTTP session connection pool
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        futures = []
 
-        # construct URL to get report for one specified cluster
-        url = f"{address}/v1/clusters/{cluster}/report"
+        for cluster in cluster_list:
+            if verbose:
+                print("Cluster: ", cluster)
 
-        if verbose:
-            print("URL to access:", url)
+            # construct URL to get report for one specified cluster
+            url = f"{address}/v1/clusters/{cluster}/report"
+
+            if verbose:
+                print("URL to access:", url)
 
-        try:
             # try to retrieve results for given cluster
-            retrieve_results_for_cluster(url, proxies, auth, cluster, verbose)
-        except Exception as e:
-            # store error to be used later
-            errors[cluster] = e
+            future = executor.submit(
+                retrieve_results_for_cluster, url, proxies, auth, cluster, verbose
+            )
+            futures.append((cluster, future))
+
+        # results are collected in the same order as clusters are read from
+        # input file, so errors are displayed in stable order too
+        for cluster, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                # store error to be used later
+                errors[cluster] = e
 
     display_errors(errors)
 
@@ -496,12 +533,12 @@ def retrieve_results_for_cluster(url, proxies, auth, cluster, verbose):
     assert "status" in payload, "'status' field needs to be present in the payload"
 
     # pretty print the output
-    results = json.dumps(payload, indent=4)
+    results = orjson.dumps(payload, option=orjson.OPT_INDENT_2)
 
     filename = "{}.json".format(cluster)
 
     # generate output file with cluster results
-    with open(filename, "w") as json_file:
+    with open(filename, "wb") as json_file:
         json_file.write(results)
 
 
@@ -561,88 +598,116 @@ def compare_results(directory1, directory2, filename, info, verbose):
     assert comparison_results is not None
     assert recommendations is not None
 
-    # create a new CSV file with detailed report of differences between two
-    # sets of results
-    with open(filename, "w") as csvfile:
-        # create a CSV writer object
-        csv_writer = csv.writer(csvfile, quotechar='"', quoting=csv.QUOTE_ALL)
-        assert csv_writer is not None, "CSV writer can not be constructed"
+    # detailed report of differences between two sets of results is prepared
+    # in memory first, so it can be written into CSV file at once
+    buffer = io.StringIO()
 
-        # export all required information into CSV file
-        export_additional_info(csv_writer, info)
-        export_basic_info(csv_writer, directory1, directory2, files1, files2, common)
+    # create a CSV writer object
+    csv_writer = csv.writer(buffer, quotechar='"', quoting=csv.QUOTE_ALL)
+    assert csv_writer is not None, "CSV writer can not be constructed"
 
-        export_redundant_clusters(
-            csv_writer, redundant_d1, "Redundand clusters in 1st directory"
-        )
-        export_redundant_clusters(
-            csv_writer, redundant_d2, "Redundand clusters in 2nd directory"
-        )
+    # export all required information into CSV buffer
+    export_additional_info(csv_writer, info)
+    export_basic_info(csv_writer, directory1, directory2, files1, files2, common)
+
+    export_redundant_clusters(
+        csv_writer, redundant_d1, "Redundand clusters in 1st directory"
+    )
+    export_redundant_clusters(
+        csv_writer, redundant_d2, "Redundand clusters in 2nd directory"
+    )
+
+    export_comparison_results(csv_writer, comparison_results)
 
-        export_comparison_results(csv_writer, comparison_results)
+    if verbose:
+        export_recommendations(csv_writer, recommendations)
 
-        if verbose:
-            export_recommendations(csv_writer, recommendations)
+    # create a new CSV file with detailed report of differences between two
+    # sets of results
+    with open(filename, "w") as csvfile:
+        csvfile.write(buffer.getvalue())
 
 
 def compare_results_sets(directory1, directory2, common, include_recommendations_table):
     """Compare two results sets."""
-    diff_results = []
-
     # There are two set of counters, first set is created for recommendations
     # read from first set of results, second set is created for recommendations
     # read from the second set of results. Counter keys are constructed from
     # `rule_id` and `error_key`
     recommendations = {"r1": Counter(), "r2": Counter()}
 
-    # iterate over all clusters
-    for cluster in sorted(common):
-        diff = {}
-        diff["cluster"] = cluster
+    # counters are updated from more threads, so access to them needs to be
+    # serialized
+    lock = Lock()
+
+    # iterate over all clusters, each cluster is compared independently in
+    # its own thread so reading of results files can overlap
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        diff_results = list(
+            executor.map(
+                lambda cluster: compare_cluster_results(
+                    directory1,
+                    directory2,
+                    cluster,
+                    include_recommendations_table,
+                    recommendations,
+                    lock,
+                ),
+                sorted(common),
+            )
+        )
+
+    return diff_results, recommendations
 
-        try:
-            # preliminary - can be changed later in exception handler
-            diff["status"] = "ok"
-            diff["error"] = ""
 
-            # not true yet!
-            diff["same_results"] = "yes"  # not true yet
+def compare_cluster_results(
+    directory1, directory2, cluster, include_recommendations_table, recommendations, lock
+):
+    """Compare results for one cluster, update recommendations table if required."""
+    diff = {}
+    diff["cluster"] = cluster
 
-            # try to read both results to be compared
-            r1 = read_cluster_results(directory1, cluster)
-            r2 = read_cluster_results(directory2, cluster)
+    try:
+        # preliminary - can be changed later in exception handler
+        diff["status"] = "ok"
+        diff["error"] = ""
 
-            # update recommendations table if required
-            if include_recommendations_table:
+        # not true yet!
+        diff["same_results"] = "yes"  # not true yet
+
+        # try to read fields from both results to be compared
+        r1 = read_cluster_report_fields(directory1, cluster)
+        r2 = read_cluster_report_fields(directory2, cluster)
+
+        # update recommendations table if required
+        if include_recommendations_table:
+            with lock:
                 update_recommendations(recommendations, r1, r2)
 
-            # 1st step is simple: rule hits counters comparison as exposed in
-            # metadata field in JSON
-            d1 = compare_rule_hits_count(r1, r2, diff)
-
-            # rule hit numbers are the same, let's continue with 2nd step
-            if d1:
-                # TODO: better comparison
-                d2 = compare_rule_hits(r1, r2, diff)
-                if d2:
-                    pass
-                else:
-                    diff["same_results"] = "no"
+        # 1st step is simple: rule hits counters comparison as exposed in
+        # metadata field in JSON
+        d1 = compare_rule_hits_count(r1, r2, diff)
+
+        # rule hit numbers are the same, let's continue with 2nd step
+        if d1:
+            # TODO: better comparison
+            d2 = compare_rule_hits(r1, r2, diff)
+            if d2:
+                pass
             else:
-                # now we know for sure, that rule hit counters are different
                 diff["same_results"] = "no"
-                diff["same_hits"] = "?"
-
-        except Exception as e:
-            # fill-in info about error that occured during results reading or
-            # during comparison
-            diff["status"] = "error"
-            diff["error"] = repr(e)
+        else:
+            # now we know for sure, that rule hit counters are different
+            diff["same_results"] = "no"
+            diff["same_hits"] = "?"
 
-        # update diff results
-        diff_results.append(diff)
+    except Exception as e:
+        # fill-in info about error that occured during results reading or
+        # during comparison
+        diff["status"] = "error"
+        diff["error"] = repr(e)
 
-    return diff_results, recommendations
+    return diff
 
 
 def update_recommendations(recommendations, results1, results2):
@@ -655,34 +720,22 @@ def update_recommendations(recommendations, results1, results2):
 
 def update_recommendations_for_results(counters, results):
     """Update counters with recommendations for selected result set."""
-    data = results["report"]["data"]
-
-    # iterate over all rule hits, check the content + update counters for each
-    # rule selector found
-    for hit in data:
-        # preliminary check if all attributes are there
-        assert "rule_id" in hit, "Expected 'rule_id' attribute"
-        assert "extra_data" in hit, "Expected 'extra_data' containing a map"
+    rule_selectors = results.rule_selectors
+
+    # preliminary check if all rule selectors are complete
+    for rule_selector in rule_selectors:
         assert (
-            "error_key" in hit["extra_data"]
+            rule_selector.error_key is not None
         ), "Expected 'extra_data' containing a map"
 
-        # construct the full rule selector
-        rule_id = hit["rule_id"]
-        error_key = hit["extra_data"]["error_key"]
-        rule_selector = ruleSelector(rule_id=rule_id, error_key=error_key)
-
-        # NOTE: the dirty trick how to use named tuple as key named tuple
-        # itself is iterable and counters.update will iterate over all items,
-        # which we don't want to. So we need to provide an one-item iterable
-        # instead
-        counters.update((rule_selector,))
+    # update counters for each rule selector found
+    counters.update(rule_selectors)
 
 
 def compare_rule_hits_count(r1, r2, diff):
     """Just compare rule hits metadata and fill-in diff structure accordingly."""
-    hits1 = r1["report"]["meta"]["count"]
-    hits2 = r2["report"]["meta"]["count"]
+    hits1 = r1.count
+    hits2 = r2.count
 
     # remember counters -> needs to be written into the table
     diff["hits1"] = hits1
@@ -699,51 +752,67 @@ def compare_rule_hits_count(r1, r2, diff):
 
 def compare_rule_hits(r1, r2, diff):
     """Compare 'read' rule hits and fill-in diff structure accordingly."""
-    d1 = r1["report"]["data"]
-    d2 = r2["report"]["data"]
-
-    all_found = True
+    # set of rule IDs found in 2nd results, so each lookup is O(1)
+    ids2 = {hit2.rule_id for hit2 in r2.rule_selectors}
 
-    for hit1 in d1:
-        found = False
-        for hit2 in d2:
-            if hit1["rule_id"] == hit2["rule_id"]:
-                found = True
-        if not found:
-            all_found = False
+    # all rule IDs from 1st results need to be found in 2nd results, so
+    # there's no need to continue when the first missing one is found
+    for hit1 in r1.rule_selectors:
+        if hit1.rule_id not in ids2:
+            diff["same_hits"] = "no"
+            return False
 
-    # result of comparison
-    diff["same_hits"] = "yes" if all_found else "no"
-
-    # return comparison result
-    return all_found
+    # all rule IDs has been found
+    diff["same_hits"] = "yes"
+    return True
 
 
 def read_cluster_results(directory, cluster):
     """Try to read results for given cluster, where results are stored in specified directory."""
     filename = f"{directory}/{cluster}.json"
 
-    with open(filename, "r") as fin:
+    with open(filename, "rb") as fin:
         raw_data = fin.read()
-        results = json.loads(raw_data)
+        results = orjson.loads(raw_data)
 
     return results
 
 
+# Fields are cached, so repeated reads of the same cluster results (for
+# example when more comparisons are made over the same directories) don't
+# need to parse the file again. Just the compact fields are cached, not the
+# whole results.
+@lru_cache(maxsize=1024)
+def read_cluster_report_fields(directory, cluster):
+    """Read just the fields needed to compare results for given cluster."""
+    report = read_cluster_results(directory, cluster)["report"]
+
+    # extra_data (and error key in it) are optional there, error key is
+    # checked only when recommendations table is to be updated
+    rule_selectors = tuple(
+        ruleSelector(
+            rule_id=hit["rule_id"],
+            error_key=(hit.get("extra_data") or {}).get("error_key"),
+        )
+        for hit in report["data"]
+    )
+
+    return reportFields(count=report["meta"]["count"], rule_selectors=rule_selectors)
+
+
 def read_list_of_clusters_from_directory(directory):
     """Read list of clusters (taken from file names) from given directory."""
-    # list of all files in directory
-    files = os.listdir(directory)
-    # filter just JSON files and get rid of file extension
-    return [f[:-5] for f in files if f.endswith(".json")]
+    # iterate over all directory entries, file type is usually known from the
+    # directory entry itself, so no additional stat call is needed
+    with os.scandir(directory) as entries:
+        # filter just JSON files and get rid of file extension
+        return [e.name[:-5] for e in entries if e.name.endswith(".json") and e.is_file()]
 
 
 def export_recommendations(csv_writer, recommendations):
     """Export recommendations taken from both results sets."""
-    # all rule selectors
-    rule_selectors = sorted(
-        set(recommendations["r1"].keys()) | set(recommendations["r2"].keys())
-    )
+    # all rule selectors (keys views support set operations directly)
+    rule_selectors = sorted(recommendations["r1"].keys() | recommendations["r2"].keys())
 
     # empty row
     csv_writer.writerow(())
@@ -834,8 +903,7 @@ def export_redundant_clusters(csv_writer, files, title):
     csv_writer.writerow(("n", "cluster"))
 
     # write all cluster names preceded by counter
-    for i, cluster in enumerate(files):
-        csv_writer.writerow((i, cluster))
+    csv_writer.writerows(enumerate(files))
 
     # empty row
     csv_writer.writerow(())
@@ -858,10 +926,12 @@ def export_comparison_results(csv_writer, comparison_results):
         )
     )
 
-    # write all cluster names preceded by counter
+    rows = []
+
+    # prepare all cluster names preceded by counter
     for i, r in enumerate(comparison_results):
         if r["status"] == "ok":
-            csv_writer.writerow(
+            rows.append(
                 (
                     i,
                     r["cluster"],
@@ -875,9 +945,10 @@ def export_comparison_results(csv_writer, comparison_results):
                 )
             )
         else:
-            csv_writer.writerow(
-                (i, r["cluster"], r["status"], "", "", "", "", "", r["error"])
-            )
+            rows.append((i, r["cluster"], r["status"], "", "", "", "", "", r["error"]))
+
+    # and write them all at once
+    csv_writer.writerows(rows)
 
 
 # If this script is started from command line, run the `main` function which is
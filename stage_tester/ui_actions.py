@@ -75,7 +75,7 @@ Notes
   EITHER -c, --cluster OR -l, --cluster-list
 
 - The file provided to --cluster-list should contain space and/or
-linebreak separated UUIDs.
+linebreak separated UUIDs. Invalid UUIDs are reported and skipped.
 
 - The --execute argument accepts multiple operations, that would be
 executed sequentially in the given order. Each operation is expected
@@ -123,7 +123,11 @@ Generated documentation in literate programming style
 
 from argparse import ArgumentParser
 from argparse import RawTextHelpFormatter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import re
 import sys
@@ -137,17 +141,33 @@ ALLOWED_OPERATIONS = {
     "disable_feedback",
 }
 
-REGISTERED_OPERATIONS = {}
+# Match any string that has alphanumeric characters separated by at least one
+# dot (".") before a vertical line ("|"), followed by only uppercase
+# characters, numbers, or underscores ("_")
+RULE_SELECTOR = re.compile(r"[a-zA-Z_0-9]+\.[a-zA-Z_0-9.]+\|[A-Z_0-9]+\Z")
 
-RULE_SELECTOR = r"[a-zA-Z_0-9]+\.[a-zA-Z_0-9.]+\|[A-Z_0-9]+$"
+# Match cluster UUID in its canonical textual form
+CLUSTER_UUID = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z", re.IGNORECASE
+)
 
+# Maximum number of clusters to interact with concurrently
+MAX_CONCURRENT_CLUSTERS = 64
 
-def register_operation(op, func, data=None):
-    """Register any operations and store it in a map."""
-    print(
-        f"{sys.argv[0]}: info: registering {op}", f"with data: {data}" if data else ""
-    )
-    REGISTERED_OPERATIONS.update({op: [func, data]})
+# HTTP code expected to be returned by REST API
+HTTP_OK = requests.codes.ok
+
+# HTTP headers sent together with JSON request body
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def register_operation(plan, op, method, data=None, verbose=None):
+    """Register any operations together with its HTTP method and store it in plan (a map)."""
+    if verbose:
+        print(
+            f"{sys.argv[0]}: info: registering {op}", f"with data: {data}" if data else ""
+        )
+    plan[op] = (method, data)
 
 
 def cli_arguments():
@@ -193,19 +213,20 @@ def cli_arguments():
         help="ID of the organization to interact with",
     )
 
-    parser.add_argument(
+    # exactly one of -c and -l needs to be provided
+    clusters_group = parser.add_mutually_exclusive_group(required=True)
+
+    clusters_group.add_argument(
         "-c",
         "--cluster",
         dest="cluster",
-        required=not ({"-l", "--cluster-list"} & set(sys.argv)),
         help="UUID of the cluster to interact with",
     )
 
-    parser.add_argument(
+    clusters_group.add_argument(
         "-l",
         "--cluster-list",
         dest="cluster_list_file",
-        required=not ({"-c", "--cluster"} & set(sys.argv)),
         help="File containing list of clusters to interact with "
         "(1 or more cluster uuid expected)",
     )
@@ -230,7 +251,6 @@ def cli_arguments():
         "-e",
         "--execute",
         dest="operations",
-        action="append",
         nargs="+",
         help=help_message_execute_op,
         required=True,
@@ -249,33 +269,130 @@ def cli_arguments():
     return parser.parse_args()
 
 
+def read_cluster_list_from_file(filename):
+    """Read list of clusters from file, cluster UUIDs are separated by whitespaces."""
+    # file is processed line by line, so it is not needed to keep its whole
+    # content in memory, duplicated clusters are removed while the order of
+    # clusters in file is kept
+    with open(filename, "r") as fin:
+        return list(dict.fromkeys(cluster for line in fin for cluster in line.split()))
+
+
+def filter_valid_clusters(clusters):
+    """Return just clusters with valid UUID, the invalid ones are reported and ignored."""
+    valid = []
+    invalid = []
+
+    # requests for invalid clusters would be rejected by REST API anyway
+    for cluster in clusters:
+        if CLUSTER_UUID.match(cluster):
+            valid.append(cluster)
+        else:
+            invalid.append(cluster)
+
+    if invalid:
+        print(
+            f"{sys.argv[0]}: warning: Ignoring {len(invalid)} invalid cluster UUID(s):",
+            ", ".join(invalid),
+        )
+
+    return valid
+
+
 def check_api_response(response):
     """Check the API response HTTP code."""
-    assert response is not None, "Proper response expected"
-    assert (
-        response.status_code == requests.codes.ok
-    ), "Received {response.status_code} when {requests.codes.ok} expected "
+    if response.status_code != HTTP_OK:
+        raise RuntimeError(f"Received {response.status_code} when {HTTP_OK} expected")
 
 
 def print_url(url, rest_op, data):
     """Print URL the script is going to access."""
-    print("\t", f"Operation: {rest_op}", url, f"{data}" if data else "")
+    print("\t", f"Operation: {rest_op}", url, data.decode() if data else "")
+
+
+def prepare_request_body(data):
+    """Serialize request data into JSON, return request body and headers to be sent."""
+    if data is None:
+        return None, None
+    return orjson.dumps(data), JSON_HEADERS
+
+
+def create_session(auth, pool_size):
+    """Create HTTP session with connection pool shared by all operations."""
+    session = requests.Session()
+    session.auth = auth
+
+    # connections are kept alive and reused by all operations, pool holds
+    # exactly one connection for each cluster processed concurrently, and
+    # when all connections are in use, operation waits for a free one instead
+    # of opening a new connection that would be discarded afterwards
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=pool_size,
+        pool_block=True,
+        max_retries=Retry(total=3, backoff_factor=0.2),
+    )
+    session.mount("https://", adapter)
 
+    return session
 
-def execute_operations(addr, proxies, auth, clusters, rule_id, error_key):
-    """Execute all operations stored in a map via REST API."""
-    for cluster in clusters:
-        for action, ops in REGISTERED_OPERATIONS.items():
-            function, payload = ops
-            url = f"{addr}clusters/{cluster}/rules/{rule_id}.report/error_key/{error_key}/{action}"
-            print_url(url, function.__name__, payload)
 
-            if payload:
-                check_api_response(
-                    function(url, proxies=proxies, auth=auth, json=payload)
-                )
-            else:
-                check_api_response(function(url, proxies=proxies, auth=auth))
+def execute_cluster_operations(session, proxies, operations, prefix, verbose):
+    """Execute given operations via REST API for one cluster, prefix is URL without action."""
+    # Please note that proxies are passed to each request explicitly, because
+    # proxies set for the whole session would be overridden by proxies
+    # specified in environment variables.
+    # Bound method is looked up just once, not for each operation.
+    request = session.request
+
+    for method, action, body, headers in operations:
+        url = prefix + action
+        if verbose:
+            print_url(url, method, body)
+
+        # no request body is sent when body is None
+        check_api_response(
+            request(method, url, proxies=proxies, data=body, headers=headers)
+        )
+
+
+def execute_operations(
+    addr, session, proxies, clusters, rule_id, error_key, plan, workers, verbose
+):
+    """Execute all operations stored in plan via REST API, return errors found for clusters."""
+    # list of operations is the same for all clusters, so request bodies are
+    # serialized into JSON just once
+    operations = [
+        (method, action, *prepare_request_body(data))
+        for action, (method, data) in plan.items()
+    ]
+
+    # Operations for one cluster need to be executed in the given order, but
+    # clusters are independent on each other, so they are processed
+    # concurrently. URL differs just in action for all operations on one
+    # cluster, so the rest of URL is prepared once per cluster.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                execute_cluster_operations,
+                session,
+                proxies,
+                operations,
+                f"{addr}clusters/{cluster}/rules/{rule_id}.report/error_key/{error_key}/",
+                verbose,
+            ): cluster
+            for cluster in clusters
+        }
+
+        # error for one cluster does not stop processing other clusters
+        errors = {}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+
+    return errors
 
 
 def main():
@@ -283,58 +400,61 @@ def main():
     # Parse and process and command line arguments.
     args = cli_arguments()
 
-    # check -c and -l args are not both provided
-    if args.cluster and args.cluster_list_file:
-        print(
-            f"{sys.argv[0]}: "
-            f"error: Please provide cluster UUID through either -c or -l, not both."
-        )
-        sys.exit(1)
-
     # validate the recommendation to work with
     selector = args.selector
-    """
-    Match any string that has alphanumeric characters separated by at least one dot
-    (".") before a vertical line ("|"), followed by only uppercase characters,
-    numbers, or underscores ("_")
-    """
-    if not re.match(RULE_SELECTOR, selector):
+    if not RULE_SELECTOR.match(selector):
         print(
             f"{sys.argv[0]}: error: Please provide a valid rule selector (rule_id|ek)"
         )
         sys.exit(1)
 
+    verbose = args.verbose
+
     # validate operation(s) to execute
-    operations = args.operations[0]
+    operations = args.operations
+
+    # all operations to be executed for each cluster, in given order
+    plan = {}
+
+    # set when the previous operation was disable_feedback, so the next
+    # token can be its feedback message
+    pending_feedback = False
+
     for op in operations:
-        if op in ALLOWED_OPERATIONS:
-            if op == "disable_feedback":
-                register_operation("disable", requests.put)
-                register_operation("disable_feedback", requests.post)
-            else:
-                register_operation(op, requests.put)
+        if pending_feedback and op not in ALLOWED_OPERATIONS:
+            # feedback message for disable_feedback
+            register_operation(
+                plan, "disable_feedback", "POST", {"message": op}, verbose=verbose
+            )
+            pending_feedback = False
+        elif op == "disable_feedback":
+            register_operation(plan, "disable", "PUT", verbose=verbose)
+            register_operation(plan, "disable_feedback", "POST", verbose=verbose)
+            pending_feedback = True
+        elif op in ALLOWED_OPERATIONS:
+            register_operation(plan, op, "PUT", verbose=verbose)
+            pending_feedback = False
         else:
-            # Only OK if it is the feedback for disable_feedback
-            if not (
-                "disable_feedback" in REGISTERED_OPERATIONS
-                and REGISTERED_OPERATIONS["disable_feedback"][1] is None
-            ):
-                print(f"{sys.argv[0]}: error: Received operation: {op}.")
-                print(f"{sys.argv[0]}: error: Expected one of {ALLOWED_OPERATIONS}.")
-                print(f"{sys.argv[0]}: error: Please provide a valid operation.")
-                sys.exit(1)
-            else:
-                register_operation("disable_feedback", requests.post, {"message": op})
+            print(f"{sys.argv[0]}: error: Received operation: {op}.")
+            print(f"{sys.argv[0]}: error: Expected one of {ALLOWED_OPERATIONS}.")
+            print(f"{sys.argv[0]}: error: Please provide a valid operation.")
+            sys.exit(1)
 
-    verbose = args.verbose
     proxies = {"https": args.proxy} if args.proxy else None
     auth = (args.user, args.password)
     clusters = (
-        {args.cluster}
+        [args.cluster]
         if args.cluster
-        else set(open(args.cluster_list_file).read().split())
+        else read_cluster_list_from_file(args.cluster_list_file)
     )
-    rule_id, error_key = selector.split("|")
+
+    # validate clusters before any REST API call is made
+    clusters = filter_valid_clusters(clusters)
+    if not clusters:
+        print(f"{sys.argv[0]}: error: Please provide at least one valid cluster UUID.")
+        sys.exit(1)
+
+    rule_id, error_key = selector.split("|", 1)
 
     if verbose:
         print("Proxy settings:", proxies)
@@ -344,9 +464,24 @@ def main():
         print("Rule selector:", selector)
         print("Rule ID:", rule_id)
         print("Error Key:", error_key)
-        print("Operations:", REGISTERED_OPERATIONS)
+        print("Operations:", plan)
+
+    # number of clusters processed concurrently, each of them uses its own
+    # connection from the pool
+    workers = min(MAX_CONCURRENT_CLUSTERS, len(clusters))
+
+    # one HTTP session is shared by all operations, so connections are reused
+    session = create_session(auth, workers)
 
-    execute_operations(args.addr, proxies, auth, clusters, rule_id, error_key)
+    errors = execute_operations(
+        args.addr, session, proxies, clusters, rule_id, error_key, plan, workers, verbose
+    )
+
+    # report all clusters where operations failed
+    if errors:
+        for cluster, e in sorted(errors.items()):
+            print(f"{sys.argv[0]}: error: Cluster {cluster}: {e!r}")
+        sys.exit(1)
 
 
 # If this script is started from command line, run the `main` function which is